@@ -2,6 +2,15 @@ import sys
 import os
 import math
 import json
+import hashlib
+import functools
+import time
+import multiprocessing as mp
+from heapq import nlargest
+from operator import itemgetter
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 sys.path.append(os.getcwd())
@@ -9,42 +18,66 @@ sys.path.append(os.getcwd())
 from src.logic import GroverAlgorithm
 from qiskit_aer import AerSimulator
 from qiskit_ibm_runtime import QiskitRuntimeService, SamplerV2 as IBMSampler
-from qiskit import transpile
+import qiskit
+from qiskit import qpy
+from qiskit.circuit import Gate, Instruction
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 
-def save_histogram(counts, target_state, filename):
-    sorted_keys = sorted(counts.keys())
-    sorted_values = [counts[k] for k in sorted_keys]
-    
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(sorted_keys, sorted_values, color='#648fff', edgecolor='black')
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+CACHE_DIR = ".transpile_cache"
+# Above this register size the text diagram is too slow to build and too wide to read
+MAX_DRAW_QUBITS = 6
+# Number of most frequent states printed with the results
+TOP_RESULTS = 10
+# Up to this register size shot outcomes are counted into a dense 2^n histogram
+DENSE_COUNT_MAX_BITS = 20
+# Seconds for which the least busy hardware backend is reused
+BACKEND_CACHE_TTL = 300
+
+# Preset pass managers, keyed by (backend name, optimization level)
+_pass_managers = {}
+# IBM Runtime samplers, keyed by backend name
+_samplers = {}
+# Least busy hardware backends, keyed by minimum qubit count: (lookup time, backend)
+_hardware_backends = {}
+
+def save_histogram(counts, target_state, filename, dpi=120):
+    keys = np.fromiter(counts.keys(), dtype=f'U{len(target_state)}', count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    order = np.argsort(keys)
+    keys, values = keys[order], values[order]
+    colors = np.where(keys == target_state, '#dc267f', '#648fff')
     
-    if target_state in sorted_keys:
-        index = sorted_keys.index(target_state)
-        bars[index].set_color('#dc267f')
-        bars[index].set_edgecolor('black')
-
-    plt.xlabel('Computational Basis States')
-    plt.ylabel('Counts')
-    plt.title(f"Grover's Algorithm Results (Target: |{target_state}>)")
-    plt.grid(axis='y', linestyle='--', alpha=0.5)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    bars = ax.bar(keys, values, color=colors, edgecolor='black')
+
+    ax.set_xlabel('Computational Basis States')
+    ax.set_ylabel('Counts')
+    ax.set_title(f"Grover's Algorithm Results (Target: |{target_state}>)")
+    ax.grid(axis='y', linestyle='--', alpha=0.5)
     
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.5,
-                 f'{int(height)}',
-                 ha='center', va='bottom')
+    ax.bar_label(bars, padding=2)
 
-    plt.savefig(filename, dpi=300)
+    fig.savefig(filename, dpi=dpi)
     print(f"> Histogram saved successfully: {filename}")
-    plt.close()
+    plt.close(fig)
 
 def load_configuration(file_name="config.json"):
     script_dir = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(script_dir, file_name)
 
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        with open(file_path, 'rb') as f:
+            return json_loads(f.read())
     except FileNotFoundError:
         print(f"[ERROR] Configuration file not found at: {file_path}")
         sys.exit(1)
@@ -52,110 +85,309 @@ def load_configuration(file_name="config.json"):
         print(f"[ERROR] File '{file_path}' is not valid JSON.")
         sys.exit(1)
 
+@functools.lru_cache(maxsize=None)
 def calculate_optimal_iterations(n_qubits, n_solutions=1):
     N = 2**n_qubits
+    # Single solution: floor(pi/4 * sqrt(N)) matches the exact expression below for N >= 4
+    if n_solutions == 1 and n_qubits >= 2:
+        return math.floor((math.pi / 4) * math.sqrt(N))
     theta = math.asin(math.sqrt(n_solutions / N))
     return round((math.pi / (4 * theta)) - 0.5)
 
-def get_backend(use_real_hardware, n_qubits):
+def gpu_available():
+    try:
+        return 'GPU' in AerSimulator().available_devices()
+    except Exception:
+        return False
+
+def get_backend(use_real_hardware, n_qubits, use_gpu=False):
     if use_real_hardware:
+        cached = _hardware_backends.get(n_qubits)
+        if cached is not None and time.monotonic() - cached[0] < BACKEND_CACHE_TTL:
+            print(f"> Reusing Backend: {cached[1].name} (Real Hardware)")
+            return cached[1]
+
         print("> Connecting to IBM Quantum Service...")
         try:
             service = QiskitRuntimeService()
             print("> Searching for least busy quantum backend...")
             backend = service.least_busy(operational=True, simulator=False, min_num_qubits=n_qubits)
             print(f"> Selected Backend: {backend.name} (Real Hardware)")
+            _hardware_backends[n_qubits] = (time.monotonic(), backend)
             return backend
         except Exception as e:
             print(f"[ERROR] Failed to connect to IBM Quantum: {e}")
             sys.exit(1)
+    elif use_gpu and gpu_available():
+        print("> Using Local Aer Simulator (GPU statevector)")
+        return AerSimulator(method='statevector', device='GPU')
     else:
+        if use_gpu:
+            print("[WARNING] No GPU support found in qiskit-aer, falling back to CPU.")
         print("> Using Local Aer Simulator")
-        return AerSimulator()
+        return AerSimulator(method='statevector')
+
+def update_circuit_digest(digest, qc):
+    # Structural fingerprint: QPY output is not stable across processes (custom gate names
+    # get random suffixes), so the instructions are hashed directly. Only gates built by
+    # to_gate() are expanded; library gates are identified by name, size and parameters.
+    digest.update(f"{qc.num_qubits}|{qc.num_clbits}|{qc.global_phase}".encode())
+    for instruction in qc.data:
+        op = instruction.operation
+        qubits = [qc.find_bit(q).index for q in instruction.qubits]
+        clbits = [qc.find_bit(c).index for c in instruction.clbits]
+        digest.update(f"|{op.name}|{qubits}|{clbits}|{op.params}".encode())
+        if type(op) in (Gate, Instruction) and op.definition is not None:
+            update_circuit_digest(digest, op.definition)
+
+def get_backend_revision(backend):
+    # Calibration date of hardware backends, so a new target invalidates the layout
+    try:
+        properties = backend.properties()
+    except Exception:
+        return ""
+    return str(getattr(properties, 'last_update_date', '') or '')
+
+def get_cache_path(qc, backend, optimization_level):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    update_circuit_digest(digest, qc)
+    digest.update(f"|{backend.name}|{get_backend_revision(backend)}|{optimization_level}|{qiskit.__version__}".encode())
+    return os.path.join(script_dir, CACHE_DIR, f"{digest.hexdigest()}.qpy")
+
+def get_pass_manager(backend, optimization_level):
+    key = (backend.name, optimization_level)
+    if key not in _pass_managers:
+        _pass_managers[key] = generate_preset_pass_manager(optimization_level=optimization_level, backend=backend)
+    return _pass_managers[key]
+
+def get_sampler(backend):
+    sampler = _samplers.get(backend.name)
+    if sampler is None:
+        sampler = IBMSampler(mode=backend)
+        _samplers[backend.name] = sampler
+    return sampler
+
+def transpile_with_cache(circuits, backend, cache_paths, optimization_level):
+    transpiled = [None] * len(circuits)
+    pending = []
+
+    for i, cache_path in enumerate(cache_paths):
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    transpiled[i] = qpy.load(f)[0]
+                print(f"\n> Loaded transpiled circuit from cache: {cache_path}")
+                continue
+            except Exception as e:
+                print(f"[WARNING] Ignoring unreadable transpile cache '{cache_path}': {e}")
+        pending.append(i)
 
-def extract_counts_from_result(job_result, use_real_hw):
+    if pending:
+        print(f"\n> Transpiling {len(pending)} circuit(s) for {backend.name} (optimization level {optimization_level})...")
+        results = get_pass_manager(backend, optimization_level).run([circuits[i] for i in pending])
+
+        for i, transpiled_qc in zip(pending, results):
+            transpiled[i] = transpiled_qc
+            os.makedirs(os.path.dirname(cache_paths[i]), exist_ok=True)
+            with open(cache_paths[i], 'wb') as f:
+                qpy.dump(transpiled_qc, f)
+
+    return transpiled
+
+def save_data_probabilities(transpiled_qc, n_qubits):
+    # Locate the data qubits after layout, so the ancilla is left out of the distribution
+    if transpiled_qc.layout is None:
+        qubits = list(range(n_qubits))
+    else:
+        qubits = transpiled_qc.layout.final_index_layout()[:n_qubits]
+    transpiled_qc.save_probabilities(qubits)
+
+def sample_counts_from_probabilities(probabilities, shots):
+    probabilities = np.asarray(probabilities, dtype=float)
+    n_qubits = len(probabilities).bit_length() - 1
+    samples = np.random.default_rng().multinomial(shots, probabilities / probabilities.sum())
+    return {format(i, f'0{n_qubits}b'): int(c) for i, c in enumerate(samples) if c}
+
+def _pack_and_count(packed, histogram):
+    # Packed bytes are big-endian: the last byte of each shot holds the lowest bits
+    for i in range(packed.shape[0]):
+        value = 0
+        for b in range(packed.shape[1]):
+            value = (value << 8) | packed[i, b]
+        histogram[value] += 1
+
+if njit is not None:
+    _pack_and_count = njit(cache=True)(_pack_and_count)
+
+def bit_array_to_counts(bit_array):
+    if bit_array.num_bits > 64:
+        return bit_array.get_counts()
+    num_bytes = bit_array.array.shape[-1]
+    packed = bit_array.array.reshape(-1, num_bytes)
+
+    if bit_array.num_bits <= DENSE_COUNT_MAX_BITS and njit is not None:
+        histogram = np.zeros(1 << bit_array.num_bits, dtype=np.int64)
+        _pack_and_count(packed, histogram)
+        states = np.flatnonzero(histogram)
+        state_counts = histogram[states]
+    else:
+        # Packed bytes are big-endian: the last byte of each shot holds the lowest bits
+        shifts = np.arange(num_bytes - 1, -1, -1, dtype=np.uint64) * np.uint64(8)
+        values = np.bitwise_or.reduce(packed.astype(np.uint64) << shifts, axis=1)
+        if bit_array.num_bits <= DENSE_COUNT_MAX_BITS:
+            histogram = np.bincount(values.astype(np.int64), minlength=1 << bit_array.num_bits)
+            states = np.flatnonzero(histogram)
+            state_counts = histogram[states]
+        else:
+            states, state_counts = np.unique(values, return_counts=True)
+
+    return {format(int(v), f'0{bit_array.num_bits}b'): int(c) for v, c in zip(states, state_counts)}
+
+def extract_counts_from_result(job_result, use_real_hw, shots, index=0):
     if not use_real_hw:
-        return job_result.get_counts()
+        return sample_counts_from_probabilities(job_result.data(index)['probabilities'], shots)
     
     try:
-        pub_result = job_result[0]
+        pub_result = job_result[index]
         data = pub_result.data
         if hasattr(data, 'c'):
-            return data.c.get_counts()
+            bit_array = data.c
         elif hasattr(data, 'meas'):
-            return data.meas.get_counts()
+            bit_array = data.meas
         else:
             first_field = list(data.keys())[0]
-            return getattr(data, first_field).get_counts()
+            bit_array = getattr(data, first_field)
+        return bit_array_to_counts(bit_array)
     except Exception as e:
         print(f"[ERROR] Failed to extract counts from V2 result: {e}")
         sys.exit(1)
 
+def get_output_filename(output_file, target, batched):
+    if not batched:
+        return output_file
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{target}{ext}"
+
+def report_results(counts, target, shots):
+    print(f"\n=== Experimental Results (Target: |{target}>) ===")
+    top_counts = nlargest(TOP_RESULTS, counts.items(), key=itemgetter(1))
+    print(dict(top_counts))
+    
+    success_count = counts.get(target, 0)
+    success_rate = (success_count / shots) * 100
+    
+    print(f"\n> Target state |{target}> found in {success_rate:.2f}% of shots.")
+    
+    top_result = top_counts[0][0]
+    if top_result == target:
+        print("\n[OUTCOME] SUCCESS: Probability peak matches target.")
+    else:
+        print("\n[OUTCOME] FAILURE: Target is not the most frequent result.")
+
 def main():
     print("=== Grover's Algorithm Simulation ===")
 
     config = load_configuration()
     
     n_qubits = config["n_qubits"]
-    target = config["target_state"]
+    targets = config["target_state"]
     shots = config["shots"]
     output_file = config.get("output_filename", "histogram.png")
+    dpi = config.get("dpi", 120)
     use_real_hw = config.get("use_real_hardware", False)
+    draw_circuit = config.get("draw_circuit", False)
+    use_gpu = config.get("use_gpu", False)
+    use_library = config.get("use_circuit_library", False)
 
-    if len(target) != n_qubits:
-        print(f"[ERROR] Target length '{len(target)}' does not match n_qubits '{n_qubits}'")
+    # A single target or a list of targets, all executed in one batched job
+    if isinstance(targets, str):
+        targets = [targets]
+    if not isinstance(targets, list) or not targets:
+        print("[ERROR] 'target_state' must be a binary string or a non-empty list of binary strings.")
+        sys.exit(1)
+    batched = len(targets) > 1
+
+    for target in targets:
+        if not isinstance(target, str) or not target or set(target) - {'0', '1'}:
+            print(f"[ERROR] Target {target!r} is not a binary string.")
+            sys.exit(1)
+        if len(target) != n_qubits:
+            print(f"[ERROR] Target length '{len(target)}' does not match n_qubits '{n_qubits}'")
+            sys.exit(1)
+
+    # Each target writes its own histogram file, so duplicates would clash
+    if len(set(targets)) != len(targets):
+        print("[ERROR] 'target_state' contains duplicate targets.")
         sys.exit(1)
 
     print("Configuration Loaded:")
     print(f"  - Qubits: {n_qubits}")
-    print(f"  - Target: |{target}>")
+    print(f"  - Target: {', '.join(f'|{t}>' for t in targets)}")
     print(f"  - Shots:  {shots}")
     print(f"  - Mode:   {'Real Hardware' if use_real_hw else 'Local Simulation'}")
     
     t_opt = calculate_optimal_iterations(n_qubits)
     print(f"\n> Optimal iterations calculated: {t_opt}")
     
-    grover = GroverAlgorithm(n_qubits, target)
-    qc = grover.build_circuit(iterations=t_opt)
+    # The ancilla-assisted MCX only pays off on hardware: Aer applies MCX natively
+    grovers = [GroverAlgorithm(n_qubits, target, use_ancilla=use_real_hw) for target in targets]
+    backend = get_backend(use_real_hw, grovers[0].num_qubits, use_gpu)
+
+    # The simulator accepts any gate set: heavy resynthesis only pays off on real hardware
+    opt_level = 3 if use_real_hw else 1
+    basis_gates = backend.operation_names if use_real_hw else None
+    # The simulator returns the exact distribution, so measurements are only needed on hardware
+    if use_library:
+        circuits = [grover.build_library_circuit(iterations=t_opt, measure=use_real_hw) for grover in grovers]
+    else:
+        circuits = [grover.build_circuit(iterations=t_opt, basis_gates=basis_gates, measure=use_real_hw)
+                    for grover in grovers]
+
+    if draw_circuit and n_qubits <= MAX_DRAW_QUBITS:
+        for target, qc in zip(targets, circuits):
+            print(f"\n=== Abstract Circuit Diagram (Target: |{target}>) ===")
+            print(qc.draw(output='text', fold=-1))
+    elif draw_circuit:
+        print(f"\n> Circuit diagram skipped: more than {MAX_DRAW_QUBITS} qubits")
+
+    cache_paths = [get_cache_path(qc, backend, opt_level) for qc in circuits]
+    transpiled_circuits = transpile_with_cache(circuits, backend, cache_paths, opt_level)
+
+    for target, transpiled_qc in zip(targets, transpiled_circuits):
+        print(f"  - |{target}> Depth: {transpiled_qc.depth()}")
+        print(f"  - |{target}> Gate Count: {transpiled_qc.count_ops()}")
 
-    print("\n=== Abstract Circuit Diagram ===")
-    print(qc.draw(output='text'))
-    
-    backend = get_backend(use_real_hw, n_qubits)
-    
-    print(f"\n> Transpiling circuit for {backend.name}...")
-    transpiled_qc = transpile(qc, backend, optimization_level=3)
-    
-    print(f"  - Depth: {transpiled_qc.depth()}")
-    print(f"  - Gate Count: {transpiled_qc.count_ops()}")
-    
-    print(f"\n> Executing job with {shots} shots...")
-    
     if use_real_hw:
-        sampler = IBMSampler(mode=backend)
-        job = sampler.run([transpiled_qc], shots=shots)
+        print(f"\n> Executing job with {len(transpiled_circuits)} circuit(s) and {shots} shots...")
+        sampler = get_sampler(backend)
+        job = sampler.run(transpiled_circuits, shots=shots)
     else:
-        job = backend.run(transpiled_qc, shots=shots)
-        
+        print(f"\n> Computing exact probabilities for {len(transpiled_circuits)} circuit(s), sampling {shots} shots...")
+        for transpiled_qc in transpiled_circuits:
+            save_data_probabilities(transpiled_qc, n_qubits)
+        job = backend.run(transpiled_circuits, shots=1, max_parallel_experiments=len(transpiled_circuits))
+
     result = job.result()
-    counts = extract_counts_from_result(result, use_real_hw)
-    
-    print("\n=== Experimental Results ===")
-    sorted_counts = dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
-    print(sorted_counts)
 
-    save_histogram(counts, target, output_file)
-    
-    success_count = counts.get(target, 0)
-    success_rate = (success_count / shots) * 100
-    
-    print(f"\n> Target state |{target}> found in {success_rate:.2f}% of shots.")
-    
-    top_result = list(sorted_counts.keys())[0]
-    if top_result == target:
-        print("\n[OUTCOME] SUCCESS: Probability peak matches target.")
-    else:
-        print("\n[OUTCOME] FAILURE: Target is not the most frequent result.")
+    # Histograms are rendered in background processes while the results are reported
+    renderers = []
+    for index, target in enumerate(targets):
+        counts = extract_counts_from_result(result, use_real_hw, shots, index)
+        histogram_file = get_output_filename(output_file, target, batched)
+        renderer = mp.Process(target=save_histogram, args=(counts, target, histogram_file, dpi))
+        renderer.start()
+        renderers.append((renderer, histogram_file))
+        report_results(counts, target, shots)
+
+    failed = False
+    for renderer, histogram_file in renderers:
+        renderer.join()
+        if renderer.exitcode != 0:
+            print(f"[ERROR] Failed to save histogram '{histogram_file}' (exit code {renderer.exitcode})")
+            failed = True
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
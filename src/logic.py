@@ -1,12 +1,26 @@
-from qiskit import QuantumCircuit
+from qiskit import QuantumCircuit, QuantumRegister, AncillaRegister, ClassicalRegister, transpile
+from qiskit.circuit.library import grover_operator
+from qiskit.synthesis import synth_mcx_1_clean_b95
+
+# On hardware, from this register size on (5+ MCX controls), the MCX gates use one ancilla
+# qubit, which turns the quadratic gate count of the ancilla-free synthesis into a linear one.
+# With 4 or fewer controls the single-ancilla synthesis does not use the ancilla at all.
+# Simulators apply MCX natively, so there the ancilla would only enlarge the statevector.
+ANCILLA_MIN_QUBITS = 6
+
+# Diffuser gates shared by all instances (the diffuser does not depend on the target),
+# keyed by (n_qubits, num_ancillas, basis_gates)
+_diffusers = {}
 
 class GroverAlgorithm:
-    def __init__(self, n_qubits, target_state):
+    def __init__(self, n_qubits, target_state, use_ancilla=False):
         """
         Initializes the Grover Algorithm builder.
         
         :param n_qubits: Dimension of the register (n).
         :param target_state: Binary string representing the winner state 'w' (e.g., '101').
+        :param use_ancilla: If True (meant for real hardware), registers of ANCILLA_MIN_QUBITS
+                            or more get one ancilla for a linear-size MCX decomposition.
         """
         self.n = n_qubits
         self.target = target_state
@@ -14,50 +28,86 @@ class GroverAlgorithm:
         # Validation: Ensure target length matches the number of qubits
         if len(target_state) != n_qubits:
             raise ValueError("Target state length must match n_qubits.")
+        
+        # Extra work qubit used by the MCX synthesis on larger hardware registers
+        self.num_ancillas = 1 if use_ancilla and n_qubits >= ANCILLA_MIN_QUBITS else 0
+        self.num_qubits = self.n + self.num_ancillas
+        
+        # Qubits that are '0' in the target string (qubit 0 is the rightmost bit)
+        self.zero_qubits = [i for i, bit in enumerate(reversed(target_state)) if bit == '0']
+
+    def _to_gate(self, qc, label, basis_gates=None):
+        """
+        Wraps a sub-circuit into a reusable Gate.
+        
+        If basis_gates is given, the sub-circuit is decomposed to that basis once here,
+        so every appended copy already carries a synthesized definition.
+        """
+        if basis_gates is not None:
+            qc = transpile(qc, basis_gates=basis_gates, optimization_level=3)
+        return qc.to_gate(label=label)
 
-    def create_oracle(self):
+    def _apply_mcz(self, qc):
+        """
+        Applies a Multi-Controlled Z gate on the data qubits, targeting the last one.
+        
+        Since Qiskit may not have a direct MCZ for all backends, it is constructed
+        using a Multi-Controlled X (MCX) sandwiched between Hadamard gates.
+        When an ancilla is available the MCX uses the recursive synthesis by Barenco et al.,
+        which needs a single clean work qubit and grows linearly in CX gates.
+        """
+        controls = list(range(self.n - 1))
+        qc.h(self.n - 1)
+        if self.num_ancillas:
+            # Qubit order of the synthesized circuit: controls, target, ancilla
+            mcx = synth_mcx_1_clean_b95(len(controls))
+            qc.compose(mcx, controls + [self.n - 1, self.n], inplace=True)
+        else:
+            qc.mcx(controls, self.n - 1)
+        qc.h(self.n - 1)
+
+    def create_oracle(self, basis_gates=None):
         """
         Constructs the Phase Oracle (Z_f).
         
         It inverts the phase only for the target state |w>.
         Transformation: |x> -> (-1)^f(x) |x>
+        
+        :param basis_gates: Optional list of gate names to pre-decompose the oracle into.
         """
-        qc = QuantumCircuit(self.n)
+        qc = QuantumCircuit(self.num_qubits, name="oracle")
         
         # 1. Apply X gates to qubits that are '0' in the target string.
         #    This 'wraps' the state so the control activates only on |11...1>.
         #    Note: Qiskit uses little-endian ordering (qubit 0 is the rightmost bit).
-        for i, bit in enumerate(reversed(self.target)):
-            if bit == '0':
-                qc.x(i)
-        
-        # 2. Apply a Multi-Controlled Z gate (MCZ).
-        #    Since Qiskit may not have a direct MCZ for all backends, we construct it
-        #    using a Multi-Controlled X (MCX) sandwiched between Hadamard gates 
-        #    on the target qubit (last qubit).
-        qc.h(self.n - 1)
-        qc.mcx(list(range(self.n - 1)), self.n - 1)
-        qc.h(self.n - 1)
+        if self.zero_qubits:
+            qc.x(self.zero_qubits)
+        
+        # 2. Apply a Multi-Controlled Z gate (MCZ) on the target qubit (last qubit).
+        self._apply_mcz(qc)
         
         # 3. Uncomputation (Reverse the X gates).
         #    This returns the qubits to their original state, leaving only the phase flipped.
-        for i, bit in enumerate(reversed(self.target)):
-            if bit == '0':
-                qc.x(i)
+        if self.zero_qubits:
+            qc.x(self.zero_qubits)
                 
-        # Convert to a gate instruction for a cleaner circuit diagram
-        oracle_gate = qc.to_instruction()
-        oracle_gate.name = "Oracle (Z_f)"
-        return oracle_gate
+        # Convert to a gate for a cleaner circuit diagram
+        return self._to_gate(qc, "Oracle (Z_f)", basis_gates)
 
-    def create_diffuser(self):
+    def create_diffuser(self, basis_gates=None):
         """
         Constructs the Diffuser Operator (Grover's Diffusion Operator).
         
         D = H^n * Z_OR * H^n = 2|u><u| - I
         This operator performs the inversion about the mean.
+        
+        :param basis_gates: Optional list of gate names to pre-decompose the diffuser into.
         """
-        qc = QuantumCircuit(self.n)
+        key = (self.n, self.num_ancillas, None if basis_gates is None else tuple(basis_gates))
+        if key in _diffusers:
+            return _diffusers[key]
+        
+        qc = QuantumCircuit(self.num_qubits, name="diffuser")
         
         # 1. Apply Hadamard gates to all qubits to transform the basis.
         qc.h(range(self.n))
@@ -66,43 +116,99 @@ class GroverAlgorithm:
         qc.x(range(self.n))
         
         # 3. Apply Multi-Controlled Z (MCZ) to perform reflection about |0...0>.
-        qc.h(self.n - 1)
-        qc.mcx(list(range(self.n - 1)), self.n - 1)
-        qc.h(self.n - 1)
+        self._apply_mcz(qc)
         
         # 4. Uncompute X and H gates (Inverse transformation).
         qc.x(range(self.n))
         qc.h(range(self.n))
         
-        diffuser_gate = qc.to_instruction()
-        diffuser_gate.name = "Diffuser (D)"
-        return diffuser_gate
+        _diffusers[key] = self._to_gate(qc, "Diffuser (D)", basis_gates)
+        return _diffusers[key]
 
-    def build_circuit(self, iterations):
+    def _create_register_circuit(self, measure):
+        """
+        Creates the empty circuit: data register, optional ancilla and classical register.
+        """
+        registers = [QuantumRegister(self.n, 'q')]
+        if self.num_ancillas:
+            registers.append(AncillaRegister(self.num_ancillas, 'a'))
+        if measure:
+            registers.append(ClassicalRegister(self.n, 'c'))
+        return QuantumCircuit(*registers)
+
+    def build_circuit(self, iterations, basis_gates=None, measure=True):
         """
         Assembles the complete Grover circuit.
         
         Sequence:
         1. Initialization (Superposition)
-        2. Grover Iterations (G = D * Z_f)
-        3. Measurement
+        2. Grover Iterations (G = D * Z_f), applied as a single G^iterations instruction
+        3. Measurement (optional)
+        
+        :param iterations: Number of Grover iterations to apply.
+        :param basis_gates: Optional list of gate names; the oracle and diffuser are
+                            decomposed to this basis once and then reused in every iteration.
+        :param measure: If False, the circuit is left unmeasured (e.g. to read exact
+                        probabilities from a simulator).
         """
-        qc = QuantumCircuit(self.n, self.n)
+        qc = self._create_register_circuit(measure)
         
         # Phase 1: Initialization
         # Create a uniform superposition |u>
         qc.h(range(self.n))
         
-        # Create the operators
-        oracle = self.create_oracle()
-        diffuser = self.create_diffuser()
+        # Create the Grover iteration G = D * Z_f (operators built once)
+        grover_iteration = QuantumCircuit(self.num_qubits, name="G")
+        grover_iteration.append(self.create_oracle(basis_gates), range(self.num_qubits))
+        grover_iteration.append(self.create_diffuser(basis_gates), range(self.num_qubits))
+        
+        # Phase 2: Grover Loop, repeated as one G^iterations instruction
+        if iterations > 0:
+            grover_power = grover_iteration.to_gate(label="G").repeat(iterations)
+            grover_power.label = f"G^{iterations}"
+            qc.append(grover_power, range(self.num_qubits))
+        
+        # Phase 3: Measurement (data qubits only, the ancilla is returned to |0>)
+        if measure:
+            qc.measure(range(self.n), range(self.n))
+        
+        return qc
+
+    def build_library_circuit(self, iterations, measure=True):
+        """
+        Assembles the Grover circuit from Qiskit's circuit library.
+        
+        Only the phase oracle is written by hand, with a generic MCX gate. The diffuser and
+        the iteration operator G come from qiskit.circuit.library.grover_operator, so the
+        transpiler's high-level synthesis picks the MCX decomposition for the backend
+        (using the ancilla register, if present, as a clean auxiliary qubit).
+        
+        :param iterations: Number of Grover iterations to apply.
+        :param measure: If False, the circuit is left unmeasured.
+        """
+        # Phase oracle Z_f on the data qubits
+        oracle = QuantumCircuit(self.n, name="oracle")
+        if self.zero_qubits:
+            oracle.x(self.zero_qubits)
+        oracle.h(self.n - 1)
+        oracle.mcx(list(range(self.n - 1)), self.n - 1)
+        oracle.h(self.n - 1)
+        if self.zero_qubits:
+            oracle.x(self.zero_qubits)
+        
+        qc = self._create_register_circuit(measure)
+        
+        # Phase 1: Initialization
+        qc.h(range(self.n))
+        
+        # Phase 2: G^iterations as a single instruction
+        if iterations > 0:
+            grover_power = grover_operator(oracle, name="G").to_gate(label="G").repeat(iterations)
+            grover_power.label = f"G^{iterations}"
+            qc.append(grover_power, range(self.n))
         
-        # Phase 2: Grover Loop
-        for _ in range(iterations):
-            qc.append(oracle, range(self.n))
-            qc.append(diffuser, range(self.n))
-            
         # Phase 3: Measurement
-        qc.measure(range(self.n), range(self.n))
+        if measure:
+            qc.measure(range(self.n), range(self.n))
         
         return qc
\ No newline at end of file